@@ -11,27 +11,69 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import functools
+import hashlib
+import importlib.metadata
 import logging
+import mmap
 import os
 import os.path
-import shutil
+import platform
+import sys
 import tarfile
-import tempfile
-import urllib.request
-from os import mkdir
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http import HTTPStatus
 from os.path import dirname, exists, getsize, join
-from pathlib import Path
 from shutil import rmtree
+from types import SimpleNamespace
 from typing import Tuple
 
 import pytest
+import requests
+from requests.adapters import HTTPAdapter
 
+import nemo
 from nemo.utils.metaclasses import Singleton
 
+# Optional accelerators for unpacking the test data, not part of the test requirements: without them the archive is
+# unpacked with zlib, as on most CI runners.
+try:
+    from isal import igzip
+
+    HAVE_ISAL = True
+except (ImportError, ModuleNotFoundError):
+    HAVE_ISAL = False
+
+try:
+    import rapidgzip
+
+    HAVE_RAPIDGZIP = True
+except (ImportError, ModuleNotFoundError):
+    HAVE_RAPIDGZIP = False
+
+# Extraction filters were added in Python 3.12 and backported to 3.10.12 and 3.11.4.
+HAVE_TARFILE_FILTERS = hasattr(tarfile, "data_filter")
+
 # Those variables probably should go to main NeMo configuration file (config.yaml).
 __TEST_DATA_FILENAME = "test_data.tar.gz"
 __TEST_DATA_URL = "https://github.com/NVIDIA/NeMo/releases/download/v1.0.0rc1/"
 __TEST_DATA_SUBDIR = ".data"
+__TEST_DATA_ETAG_FILENAME = __TEST_DATA_FILENAME + ".etag"
+__TEST_DATA_SENTINEL_FILENAME = ".extracted_sha256"
+# Read the test archive in 1 MiB blocks instead of tarfile's default 10 KiB records.
+__TEST_DATA_BUFSIZE = 1024 * 1024
+# Number of concurrent range requests used to download the test archive.
+__TEST_DATA_DOWNLOAD_CONNECTIONS = 8
+
+# Test dir and archive filepath.
+_TEST_DIR = join(dirname(__file__), __TEST_DATA_SUBDIR)
+_TEST_ARCHIVE = join(_TEST_DIR, __TEST_DATA_FILENAME)
+
+# Folders created by training runs in the working directory, removed after every test.
+_LOCAL_EXPERIMENT_DIRS = frozenset({"lightning_logs", "NeMo_experiments", "nemo_experiments"})
+
+# Command-line options checked by the per-test fixtures, stored on the pytest config by `pytest_configure`.
+_NEMO_OPTS_KEY = pytest.StashKey[SimpleNamespace]()
 
 
 def pytest_addoption(parser):
@@ -70,52 +112,53 @@ def pytest_addoption(parser):
 @pytest.fixture
 def device(request):
     """Simple fixture returning string denoting the device [CPU | GPU]"""
-    if request.config.getoption("--cpu"):
+    if request.config.stash[_NEMO_OPTS_KEY].cpu:
         return "CPU"
     else:
         return "GPU"
 
 
 @pytest.fixture(autouse=True)
-def run_only_on_device_fixture(request, device):
-    if request.node.get_closest_marker('run_only_on'):
-        if request.node.get_closest_marker('run_only_on').args[0] != device:
+def apply_skip_markers(request, device):
+    """Skips the test based on its `run_only_on`, `with_downloads` and `nightly` markers."""
+    # Collect the markers in a single pass over the node tree, keeping the closest one for each name.
+    markers = {}
+    for marker in request.node.iter_markers():
+        markers.setdefault(marker.name, marker)
+
+    if 'run_only_on' in markers:
+        if markers['run_only_on'].args[0] != device:
             pytest.skip('skipped on this device: {}'.format(device))
 
-
-@pytest.fixture(autouse=True)
-def downloads_weights(request, device):
-    if request.node.get_closest_marker('with_downloads'):
-        if not request.config.getoption("--with_downloads"):
+    if 'with_downloads' in markers:
+        if not request.config.stash[_NEMO_OPTS_KEY].downloads:
             pytest.skip(
                 'To run this test, pass --with_downloads option. It will download (and cache) models from cloud.'
             )
 
-
-@pytest.fixture(autouse=True)
-def run_nightly_test_for_qa(request, device):
-    if request.node.get_closest_marker('nightly'):
-        if not request.config.getoption("--nightly"):
+    if 'nightly' in markers:
+        if not request.config.stash[_NEMO_OPTS_KEY].nightly:
             pytest.skip(
                 'To run this test, pass --nightly option. It will run any tests marked with "nightly". Currently, These tests are mostly used for QA.'
             )
 
 
+def _find_local_experiment_dirs():
+    # A single directory scan instead of probing every folder name separately.
+    with os.scandir(".") as entries:
+        return sorted(entry.name for entry in entries if entry.name in _LOCAL_EXPERIMENT_DIRS)
+
+
 @pytest.fixture(autouse=True)
 def cleanup_local_folder():
     # Asserts in fixture are not recommended, but I'd rather stop users from deleting expensive training runs
-    assert not Path("./lightning_logs").exists()
-    assert not Path("./NeMo_experiments").exists()
-    assert not Path("./nemo_experiments").exists()
+    present = _find_local_experiment_dirs()
+    assert not present, "pre-existing dirs: {}".format(present)
 
     yield
 
-    if Path("./lightning_logs").exists():
-        rmtree('./lightning_logs', ignore_errors=True)
-    if Path("./NeMo_experiments").exists():
-        rmtree('./NeMo_experiments', ignore_errors=True)
-    if Path("./nemo_experiments").exists():
-        rmtree('./nemo_experiments', ignore_errors=True)
+    for name in _find_local_experiment_dirs():
+        rmtree(name, ignore_errors=True)
 
 
 @pytest.fixture(autouse=True)
@@ -123,17 +166,43 @@ def reset_singletons():
     Singleton._Singleton__instances = {}
 
 
+def _take_environ_snapshot(snapshot):
+    snapshot.environ = dict(os.environ)
+    # `os.environ._data` is the underlying (encoded) dict, comparing a copy of it against it is done in C.
+    snapshot.data = os.environ._data.copy()
+    return snapshot
+
+
+def _restore_environ(snapshot):
+    # Only touch the variables that differ, instead of unsetting and setting again the whole environment.
+    for key in os.environ.keys() - snapshot.environ.keys():
+        del os.environ[key]
+    for key, value in snapshot.environ.items():
+        if os.environ.get(key) != value:
+            os.environ[key] = value
+
+
+@pytest.fixture(scope="session")
+def environ_snapshot():
+    """
+    Snapshot of the environment variables taken once per session instead of before every test.
+    It is refreshed only when a higher-scoped fixture changes the environment.
+    """
+    return _take_environ_snapshot(SimpleNamespace())
+
+
 @pytest.fixture(autouse=True)
-def reset_env_vars():
-    # Store the original environment variables before the test
-    original_env = dict(os.environ)
+def reset_env_vars(environ_snapshot):
+    # Pick up changes made by module or class fixtures since the last test
+    if os.environ._data != environ_snapshot.data:
+        _take_environ_snapshot(environ_snapshot)
 
     # Run the test
     yield
 
-    # After the test, restore the original environment
-    os.environ.clear()
-    os.environ.update(original_env)
+    # After the test, restore the original environment, if the test changed it
+    if os.environ._data != environ_snapshot.data:
+        _restore_environ(environ_snapshot)
 
 
 @pytest.fixture(scope="session")
@@ -142,52 +211,409 @@ def test_data_dir():
     Fixture returns test_data_dir.
     Use the highest fixture scope `session` to allow other fixtures with any other scope to use it.
     """
-    # Test dir.
-    test_data_dir_ = join(dirname(__file__), __TEST_DATA_SUBDIR)
-    return test_data_dir_
+    return _TEST_DIR
 
 
-def extract_data_from_tar(test_dir, test_data_archive, url=None, local_data=False):
-    # Remove .data folder.
-    if exists(test_dir):
-        if not local_data:
-            rmtree(test_dir)
+class _TeeReader:
+    """
+    Minimal read-only file object passing everything read from `source` through to an optional `sink`,
+    while computing the SHA-256 of the data on the fly.
+    Lets `tarfile` consume an HTTP response in stream mode while the archive is saved to disk.
+    """
+
+    def __init__(self, source, sink=None):
+        self._source = source
+        self._sink = sink
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self._source.read(size)
+        self.sha256.update(chunk)
+        if self._sink is not None:
+            self._sink.write(chunk)
+        return chunk
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[: len(chunk)] = chunk
+        return len(chunk)
+
+    def drain(self):
+        """Reads the remainder of `source` (e.g. tar padding left unread by `tarfile`), so the digest is complete."""
+        self.read()
+
+
+def _sha256(path):
+    """Returns the hex SHA-256 digest of the file at `path`, hashing it in C without intermediate copies."""
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            # Python 3.11+
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        sha256 = hashlib.sha256()
+        # An empty file cannot be memory-mapped.
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                sha256.update(m)
+        return sha256.hexdigest()
+
+
+def _is_extracted(test_dir, test_data_sha256):
+    """
+    Checks whether `test_dir` holds a complete extraction of the archive with the given digest.
+    The sentinel is written only after a successful extraction, so an interrupted one is never reused.
+    """
+    try:
+        with open(join(test_dir, __TEST_DATA_SENTINEL_FILENAME)) as f:
+            if f.read().strip() != test_data_sha256:
+                return False
+    except OSError:
+        return False
+    bookkeeping_files = {__TEST_DATA_FILENAME, __TEST_DATA_ETAG_FILENAME, __TEST_DATA_SENTINEL_FILENAME}
+    return any(name not in bookkeeping_files for name in os.listdir(test_dir))
+
+
+def _write_file_atomic(path, content):
+    """Writes `content` to a temporary file next to `path` and moves it in place, so readers never see partial data."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _create_session():
+    """Creates a session keeping one pooled, retrying connection per concurrent download request."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=__TEST_DATA_DOWNLOAD_CONNECTIONS, max_retries=3)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _open_test_data_url(session, url, etag=None):
+    """
+    Sends a single (conditional) GET for the remote test archive, without reading the body yet.
+    Returns the open response, or None if the server reports that the archive matching `etag` is still current.
+    """
+    headers = {"If-None-Match": etag} if etag is not None else {}
+    response = session.get(url, headers=headers, stream=True, timeout=60)
+    if response.status_code == HTTPStatus.NOT_MODIFIED:
+        response.close()
+        return None
+    response.raise_for_status()
+    # Undo a transport-level Content-Encoding, so the body is always the .tar.gz itself.
+    response.raw.decode_content = True
+    return response
+
+
+def _supports_range_download(response):
+    return (
+        hasattr(os, "pwrite")
+        and response.headers.get("Accept-Ranges") == "bytes"
+        and response.headers.get("Content-Length") is not None
+        and response.headers.get("Content-Encoding") is None
+    )
+
+
+def _download_in_ranges(session, response, path):
+    """
+    Downloads the body of `response` into `path` with concurrent HTTP range requests,
+    each of them writing its slice at the right offset of the preallocated file.
+    """
+    url = response.url
+    size = int(response.headers["Content-Length"])
+    # Every range must come from the same version of the archive, otherwise the server answers 200 instead of 206.
+    # If-Range only accepts a strong ETag, a weak one would make the server ignore every range.
+    etag = response.headers.get("ETag")
+    if etag is not None and etag.startswith("W/"):
+        etag = None
+    response.close()
+
+    chunk_size = max(-(-size // __TEST_DATA_DOWNLOAD_CONNECTIONS), __TEST_DATA_BUFSIZE)
+
+    def download_range(fd, start):
+        end = min(start + chunk_size, size) - 1
+        headers = {"Range": "bytes={}-{}".format(start, end)}
+        if etag is not None:
+            headers["If-Range"] = etag
+        with session.get(url, headers=headers, stream=True, timeout=60) as r:
+            r.raise_for_status()
+            if r.status_code != HTTPStatus.PARTIAL_CONTENT:
+                raise IOError("Range request for `{}` was not honored (HTTP {})".format(url, r.status_code))
+            offset = start
+            for block in r.iter_content(__TEST_DATA_BUFSIZE):
+                view = memoryview(block)
+                while view:
+                    written = os.pwrite(fd, view, offset)
+                    view = view[written:]
+                    offset += written
+        if offset != end + 1:
+            raise IOError("Incomplete range {}-{} downloaded from `{}`".format(start, end, url))
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
         else:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                print("Copying local tarfile to temporary storage..")
-                shutil.copy2(test_data_archive, temp_dir)
-                print("Deleting test dir to cleanup old data")
-                rmtree(test_dir)
-                mkdir(test_dir)
-                print("Restoring local tarfile to test dir")
-                shutil.copy2(os.path.join(temp_dir, os.path.basename(test_data_archive)), test_data_archive)
-
-    # Create one .data folder.
-    if not exists(test_dir):
-        mkdir(test_dir)
-
-    # Download (if required)
-    if url is not None and not local_data:
-        urllib.request.urlretrieve(url, test_data_archive)
-
-    # Extract tar
+            os.ftruncate(fd, size)
+        with ThreadPoolExecutor(max_workers=__TEST_DATA_DOWNLOAD_CONNECTIONS) as pool:
+            futures = [pool.submit(download_range, fd, start) for start in range(0, size, chunk_size)]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(fd)
+
+
+def _write_member(target, data, mode, mtime):
+    """
+    Writes the contents of a regular tar member to `target`, preserving its mode and mtime.
+    Works on the raw file descriptor, skipping the buffered file object and repeated path lookups.
+    """
+    fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o600)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+        if os.chmod in os.supports_fd:
+            os.chmod(fd, mode)
+        if os.utime in os.supports_fd:
+            os.utime(fd, (mtime, mtime))
+    finally:
+        os.close(fd)
+    if os.chmod not in os.supports_fd:
+        os.chmod(target, mode)
+    if os.utime not in os.supports_fd:
+        os.utime(target, (mtime, mtime))
+
+
+def _filter_member(member, path):
+    """
+    Applies the `data` extraction filter to a tar member. Without extraction filters, only the same containment
+    checks are done: the member, and the target of a link, must stay inside `path`.
+    """
+    if HAVE_TARFILE_FILTERS:
+        return tarfile.data_filter(member, path)
+
+    if member.ischr() or member.isblk():
+        raise tarfile.ExtractError("{!r} is a special file".format(member.name))
+    dest_path = os.path.realpath(path)
+    targets = [join(dest_path, member.name)]
+    if member.issym():
+        targets.append(join(dirname(targets[0]), member.linkname))
+    elif member.islnk():
+        targets.append(join(dest_path, member.linkname))
+    for target in targets:
+        if os.path.commonpath([dest_path, os.path.realpath(target)]) != dest_path:
+            raise tarfile.ExtractError("{!r} would be extracted outside of the destination".format(member.name))
+    return member
+
+
+def _extract_tar_stream(fileobj, path, compressed=True):
+    """
+    Extracts a tar stream, gzipped unless `compressed` is False, into `path` in a single pass.
+    Decompression is inherently sequential and stays on the calling thread, while writing the regular files
+    to disk is dispatched to a thread pool. Directories, links and members larger than the read buffer are
+    extracted inline.
+    Every member goes through the `data` extraction filter, as with `extractall(filter="data")`.
+    """
+    max_workers = os.cpu_count() or 1
+    extract_kwargs = {"filter": "data"} if HAVE_TARFILE_FILTERS else {}
+    if not compressed:
+        tar = tarfile.open(fileobj=fileobj, mode="r|", bufsize=__TEST_DATA_BUFSIZE, copybufsize=__TEST_DATA_BUFSIZE)
+    elif HAVE_ISAL:
+        # ISA-L's SIMD inflate is several times faster than zlib, so tarfile gets the decompressed stream.
+        fileobj = igzip.IGzipFile(fileobj=fileobj, mode="rb")
+        tar = tarfile.open(fileobj=fileobj, mode="r|", bufsize=__TEST_DATA_BUFSIZE, copybufsize=__TEST_DATA_BUFSIZE)
+    else:
+        tar = tarfile.open(fileobj=fileobj, mode="r|gz", bufsize=__TEST_DATA_BUFSIZE, copybufsize=__TEST_DATA_BUFSIZE)
+    with tar, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Pending writes by target path.
+        pending = {}
+        known_dirs = set()
+        directories = []
+        for member in tar:
+            # Rejects absolute paths, `..` components and links pointing outside of `path`, and sanitizes modes.
+            member = _filter_member(member, path)
+            target = os.path.normpath(join(path, member.name))
+            # As with `extractall`, the last member with a given name wins, so an earlier write to it must land first.
+            previous = pending.pop(target, None)
+            if previous is not None:
+                previous.result()
+            if member.isfile() and member.size <= __TEST_DATA_BUFSIZE:
+                # Parent directories are created once, here, instead of being checked by every write.
+                parent = dirname(target)
+                if parent not in known_dirs:
+                    os.makedirs(parent, exist_ok=True)
+                    known_dirs.add(parent)
+                data = tar.extractfile(member).read()
+                pending[target] = pool.submit(_write_member, target, data, member.mode, member.mtime)
+                # Bound the number of decoded members held in memory, each one is at most `__TEST_DATA_BUFSIZE` bytes.
+                if len(pending) >= 2 * max_workers:
+                    done, _ = wait(pending.values(), return_when=FIRST_COMPLETED)
+                    pending = {target: future for target, future in pending.items() if future not in done}
+                    for future in done:
+                        future.result()
+            elif member.isdir():
+                # Like `extractall`, directory attributes are set last, so a read-only directory can be filled first.
+                tar.extract(member, path=path, set_attrs=False, **extract_kwargs)
+                directories.append(member)
+            elif member.isfile():
+                # Larger members are copied inline in `__TEST_DATA_BUFSIZE` chunks rather than being read into memory.
+                tar.extract(member, path=path, **extract_kwargs)
+            else:
+                if member.islnk():
+                    # A hard link needs its target on disk.
+                    wait(pending.values())
+                tar.extract(member, path=path, **extract_kwargs)
+        for future in pending.values():
+            future.result()
+
+        for directory in sorted(directories, key=lambda d: d.name, reverse=True):
+            dirpath = join(path, directory.name)
+            tar.utime(directory, dirpath)
+            tar.chmod(directory, dirpath)
+
+
+def extract_data_from_tar(
+    test_dir, test_data_archive, response=None, local_data=False, session=None, test_data_sha256=None
+):
+    """
+    Replaces `test_dir` with the contents of the archive, streamed from `response` or read from `test_data_archive`.
+    `test_data_sha256` is the digest of a local archive, if the caller already knows it, otherwise it is computed.
+    """
+    if local_data:
+        # Move the local tarfile next to the test dir while cleaning it up. Both are on the same filesystem,
+        # so this is a cheap rename rather than copying the whole archive out and back.
+        # The hidden `.staged` name cannot clash with a user's file next to the test dir.
+        staged_archive = join(dirname(test_dir), "." + os.path.basename(test_data_archive) + ".staged")
+        os.replace(test_data_archive, staged_archive)
+        print("Deleting test dir to cleanup old data")
+
+    # Replace the .data folder with an empty one.
+    try:
+        rmtree(test_dir, ignore_errors=True)
+        os.makedirs(test_dir, exist_ok=True)
+    finally:
+        if local_data:
+            print("Restoring local tarfile to test dir")
+            os.replace(staged_archive, test_data_archive)
+
+    # Download (if required) and extract tar
+    if response is not None and not local_data and session is not None and _supports_range_download(response):
+        # Fetch the archive over several connections, it is then extracted like a local one.
+        url = response.url
+        try:
+            _download_in_ranges(session, response, test_data_archive)
+            response = None
+        except IOError as e:
+            print("Range download failed ({}), downloading `{}` in a single request instead.".format(e, url))
+            response = _open_test_data_url(session, url)
+
     print("Extracting the `{}` test archive, please wait...".format(test_data_archive))
-    tar = tarfile.open(test_data_archive)
-    tar.extractall(path=test_dir)
-    tar.close()
+    if response is not None and not local_data:
+        # Stream the response straight into the decompressor, so download and extraction overlap.
+        # A copy of the archive is still written to the test dir for `--use_local_test_data` runs.
+        with response, open(test_data_archive, "wb") as archive:
+            stream = _TeeReader(response.raw, archive)
+            _extract_tar_stream(stream, test_dir)
+            stream.drain()
+        test_data_sha256 = stream.sha256.hexdigest()
+    elif HAVE_RAPIDGZIP:
+        # Archives on disk are inflated by parallel workers, which read the file out of order,
+        # so the digest, when unknown, takes a separate pass.
+        with rapidgzip.open(test_data_archive, parallelization=os.cpu_count() or 1) as archive:
+            _extract_tar_stream(archive, test_dir, compressed=False)
+        if test_data_sha256 is None:
+            test_data_sha256 = _sha256(test_data_archive)
+    elif test_data_sha256 is not None:
+        with open(test_data_archive, "rb") as archive:
+            _extract_tar_stream(archive, test_dir)
+    else:
+        # Local archives go through the same single pass, so the digest comes for free.
+        with open(test_data_archive, "rb") as archive:
+            stream = _TeeReader(archive)
+            _extract_tar_stream(stream, test_dir)
+            stream.drain()
+        test_data_sha256 = stream.sha256.hexdigest()
 
+    # Mark the extraction as complete.
+    _write_file_atomic(join(test_dir, __TEST_DATA_SENTINEL_FILENAME), test_data_sha256)
 
-@pytest.fixture(scope="session")
-def k2_is_appropriate() -> Tuple[bool, str]:
+
+def _cached_value(config, name, key, compute):
+    """
+    Returns the value stored as `nemo/<name>` in the pytest cache (.pytest_cache) if it was stored for the same `key`,
+    otherwise calls `compute` and stores its result, so that later sessions can reuse it.
+    Both `key` and the value must be JSON-serializable, note that tuples are read back as lists.
+    """
+    # The cache is missing when the cacheprovider plugin is disabled.
+    cache = getattr(config, "cache", None)
+    if cache is not None:
+        cached = cache.get("nemo/" + name, None)
+        if cached is not None and cached["key"] == key:
+            return cached["value"]
+
+    value = compute()
+    if cache is not None:
+        cache.set("nemo/" + name, {"key": key, "value": value})
+    return value
+
+
+def _archive_sha256(config, path):
+    """Returns the SHA-256 of the archive, only rehashing it when its size or mtime changed since the last session."""
+    stat = os.stat(path)
+    return _cached_value(config, "test_data_sha256", [path, stat.st_size, stat.st_mtime_ns], lambda: _sha256(path))
+
+
+@functools.cache
+def _probe_k2() -> Tuple[bool, str]:
     try:
         from nemo.core.utils.k2_guard import k2  # noqa: E402
 
         return True, "k2 is appropriate."
     except Exception as e:
-        logging.exception(e, exc_info=True)
+        # k2 is expected to be missing in most environments, the full traceback is only useful when debugging it.
+        if os.environ.get("NEMO_DEBUG_K2"):
+            logging.exception(e, exc_info=True)
+        else:
+            logging.debug("k2 unavailable: %s", e)
         return False, "k2 is not available or does not meet the requirements."
 
 
+def _k2_probe_key():
+    """
+    Identifies the host, packages and k2 requirements a k2 probe result is valid for, without importing torch or k2.
+    The digest of `nemo/core/utils/k2_guard.py` covers changes to the minimum k2 version in a development checkout.
+    """
+
+    def dist_version(name):
+        try:
+            return importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            return None
+
+    with open(join(dirname(nemo.__file__), "core", "utils", "k2_guard.py"), "rb") as f:
+        k2_guard_sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    return [
+        platform.node(),
+        sys.version,
+        dist_version("nemo_toolkit"),
+        k2_guard_sha256,
+        dist_version("torch"),
+        dist_version("lightning"),
+        dist_version("k2"),
+    ]
+
+
+@pytest.fixture(scope="session")
+def k2_is_appropriate(request) -> Tuple[bool, str]:
+    if os.environ.get("NEMO_DEBUG_K2"):
+        # Always retry the import, so that the failure is logged.
+        return _probe_k2()
+    # Later sessions in the same environment skip the k2 import attempt.
+    return tuple(_cached_value(request.config, "k2_probe", _k2_probe_key(), lambda: list(_probe_k2())))
+
+
 @pytest.fixture(scope="session")
 def k2_cuda_is_enabled(k2_is_appropriate) -> Tuple[bool, str]:
     if not k2_is_appropriate[0]:
@@ -209,8 +635,10 @@ def pytest_configure(config):
     """
     Initial configuration of conftest.
     The function checks if test_data.tar.gz is present in tests/.data.
-    If so, compares its size with github's test_data.tar.gz.
-    If file absent or sizes not equal, function downloads the archive from github and unpacks it.
+    If so, asks github whether it still matches the stored ETag of the remote test_data.tar.gz.
+    If file absent or outdated, function downloads the archive from github and unpacks it.
+    The download uses parallel range requests when the server supports them, otherwise the archive is unpacked
+    while it is streamed from a single request.
     """
     config.addinivalue_line(
         "markers",
@@ -224,9 +652,14 @@ def pytest_configure(config):
         "markers",
         "nightly: runs the nightly test for QA.",
     )
-    # Test dir and archive filepath.
-    test_dir = join(dirname(__file__), __TEST_DATA_SUBDIR)
-    test_data_archive = join(dirname(__file__), __TEST_DATA_SUBDIR, __TEST_DATA_FILENAME)
+    # Options checked by the per-test fixtures, resolved once.
+    config.stash[_NEMO_OPTS_KEY] = SimpleNamespace(
+        cpu=config.getoption("--cpu"),
+        downloads=config.getoption("--with_downloads"),
+        nightly=config.getoption("--nightly"),
+    )
+    test_dir = _TEST_DIR
+    test_data_archive = _TEST_ARCHIVE
 
     # Get size of local test_data archive.
     try:
@@ -245,49 +678,87 @@ def pytest_configure(config):
                 )
             )
 
-    # Get size of remote test_data archive.
-    url = None
+    # Check the remote test_data archive.
     if not config.option.use_local_test_data:
-        try:
+        with _create_session() as session:
             url = __TEST_DATA_URL + __TEST_DATA_FILENAME
-            u = urllib.request.urlopen(url)
-        except:
-            # Couldn't access remote archive.
-            if test_data_local_size == -1:
-                pytest.exit("Test data not present in the system and cannot access the '{}' URL".format(url))
-            else:
+            test_data_etag_file = join(test_dir, __TEST_DATA_ETAG_FILENAME)
+
+            # The stored ETag is only meaningful together with the archive it was downloaded with.
+            test_data_local_etag = None
+            if test_data_local_size != -1 and exists(test_data_etag_file):
+                with open(test_data_etag_file) as f:
+                    test_data_local_etag = f.read().strip()
+
+            try:
+                u = _open_test_data_url(session, url, etag=test_data_local_etag)
+            except:
+                # Couldn't access remote archive.
+                if test_data_local_size == -1:
+                    pytest.exit("Test data not present in the system and cannot access the '{}' URL".format(url))
+                else:
+                    print(
+                        "Cannot access the '{}' URL, using the test data ({}B) found in the `{}` folder.".format(
+                            url, test_data_local_size, test_dir
+                        )
+                    )
+                    return
+
+            if u is None:
                 print(
-                    "Cannot access the '{}' URL, using the test data ({}B) found in the `{}` folder.".format(
-                        url, test_data_local_size, test_dir
+                    "A valid `{}` test archive ({}B) found in the `{}` folder.".format(
+                        __TEST_DATA_FILENAME, test_data_local_size, test_dir
                     )
                 )
-                return
-
-        # Get metadata.
-        meta = u.info()
-        test_data_remote_size = int(meta["Content-Length"])
+            else:
+                with u:
+                    # Get metadata.
+                    test_data_remote_etag = u.headers.get("ETag")
+                    test_data_remote_size = u.headers.get("Content-Length")
+
+                    # Servers that do not send an ETag fall back to comparing sizes.
+                    if (
+                        test_data_remote_etag is None
+                        and test_data_remote_size is not None
+                        and int(test_data_remote_size) == test_data_local_size
+                    ):
+                        print(
+                            "A valid `{}` test archive ({}B) found in the `{}` folder.".format(
+                                __TEST_DATA_FILENAME, test_data_local_size, test_dir
+                            )
+                        )
+                    else:
+                        print(
+                            "Downloading the `{}` test archive from `{}`, please wait...".format(
+                                __TEST_DATA_FILENAME, __TEST_DATA_URL
+                            )
+                        )
+
+                        extract_data_from_tar(
+                            test_dir,
+                            test_data_archive,
+                            response=u,
+                            local_data=config.option.use_local_test_data,
+                            session=session,
+                        )
+                        if test_data_remote_etag is not None:
+                            _write_file_atomic(test_data_etag_file, test_data_remote_etag)
 
-        # Compare sizes.
-        if test_data_local_size != test_data_remote_size:
+    else:
+        # untar local test data, unless it is already extracted
+        test_data_sha256 = _archive_sha256(config, test_data_archive)
+        if _is_extracted(test_dir, test_data_sha256):
             print(
-                "Downloading the `{}` test archive from `{}`, please wait...".format(
-                    __TEST_DATA_FILENAME, __TEST_DATA_URL
-                )
+                "The `{}` test archive is already extracted in the `{}` folder.".format(__TEST_DATA_FILENAME, test_dir)
             )
-
-            extract_data_from_tar(test_dir, test_data_archive, url=url, local_data=config.option.use_local_test_data)
-
         else:
-            print(
-                "A valid `{}` test archive ({}B) found in the `{}` folder.".format(
-                    __TEST_DATA_FILENAME, test_data_local_size, test_dir
-                )
+            extract_data_from_tar(
+                test_dir,
+                test_data_archive,
+                local_data=config.option.use_local_test_data,
+                test_data_sha256=test_data_sha256,
             )
 
-    else:
-        # untar local test data
-        extract_data_from_tar(test_dir, test_data_archive, local_data=config.option.use_local_test_data)
-
     if config.option.relax_numba_compat is not None:
         from nemo.core.utils import numba_utils
 
@@ -0,0 +1,345 @@
+# Copyright (c) 2025, NVIDIA CORPORATION.  All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import io
+import os
+import re
+import tarfile
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from pytest_httpserver import HTTPServer
+from werkzeug import Request, Response
+
+import tests.conftest as nemo_conftest
+from tests.conftest import (
+    _NEMO_OPTS_KEY,
+    _cached_value,
+    _create_session,
+    _download_in_ranges,
+    _extract_tar_stream,
+    _is_extracted,
+    _open_test_data_url,
+    _restore_environ,
+    _supports_range_download,
+    _take_environ_snapshot,
+    extract_data_from_tar,
+)
+
+ETAG = '"v1"'
+
+
+def _range_handler(data, honor_ranges=True):
+    """Serves `data`, answering range requests matching `ETAG` with a 206 when `honor_ranges` is set."""
+
+    def handler(request: Request) -> Response:
+        headers = {"ETag": ETAG, "Accept-Ranges": "bytes"}
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", request.headers.get("Range", ""))
+        if not honor_ranges or match is None or request.headers.get("If-Range") != ETAG:
+            return Response(data, headers=headers)
+        start, end = int(match.group(1)), int(match.group(2))
+        headers["Content-Range"] = "bytes {}-{}/{}".format(start, end, len(data))
+        return Response(data[start : end + 1], status=206, headers=headers)
+
+    return handler
+
+
+def _make_tar(files, compressed=True):
+    """Builds an in-memory tar archive, `files` maps member names to their contents or to TarInfo templates."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz" if compressed else "w") as tar:
+        for name, content in files.items():
+            if isinstance(content, tarfile.TarInfo):
+                content.name = name
+                tar.addfile(content)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def _tar_info(member_type, linkname="", mtime=0):
+    info = tarfile.TarInfo()
+    info.type = member_type
+    info.mode = 0o755
+    info.linkname = linkname
+    info.mtime = mtime
+    return info
+
+
+def _local_test_data(tmp_path, data):
+    """Writes `data` as the local archive of a `.data` folder in `tmp_path`, returns the folder and archive paths."""
+    test_dir = tmp_path / ".data"
+    test_dir.mkdir()
+    (test_dir / "test_data.tar.gz").write_bytes(data)
+    return str(test_dir), str(test_dir / "test_data.tar.gz")
+
+
+class _FakeCache:
+    """In-memory stand-in for `config.cache`."""
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def get(self, key, default):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class TestTestDataDownload:
+    @pytest.mark.unit
+    def test_not_modified(self, httpserver: HTTPServer):
+        httpserver.expect_request("/test_data.tar.gz", headers={"If-None-Match": ETAG}).respond_with_data(
+            "", status=304
+        )
+        with _create_session() as session:
+            assert _open_test_data_url(session, httpserver.url_for("/test_data.tar.gz"), etag=ETAG) is None
+
+    @pytest.mark.unit
+    def test_modified(self, httpserver: HTTPServer):
+        httpserver.expect_request("/test_data.tar.gz").respond_with_data(b"new", headers={"ETag": '"v2"'})
+        with _create_session() as session:
+            with _open_test_data_url(session, httpserver.url_for("/test_data.tar.gz"), etag=ETAG) as response:
+                assert response.headers["ETag"] == '"v2"'
+                assert response.raw.read() == b"new"
+
+    @pytest.mark.unit
+    def test_download_in_ranges(self, httpserver: HTTPServer, tmp_path):
+        # Large enough to be split into several ranges.
+        data = os.urandom(3 * 1024 * 1024 + 123)
+        httpserver.expect_request("/test_data.tar.gz").respond_with_handler(_range_handler(data))
+        path = str(tmp_path / "test_data.tar.gz")
+        with _create_session() as session:
+            response = _open_test_data_url(session, httpserver.url_for("/test_data.tar.gz"))
+            assert _supports_range_download(response)
+            _download_in_ranges(session, response, path)
+
+        with open(path, "rb") as f:
+            assert f.read() == data
+
+    @pytest.mark.unit
+    def test_download_in_ranges_rejects_full_response(self, httpserver: HTTPServer, tmp_path):
+        data = os.urandom(3 * 1024 * 1024)
+        httpserver.expect_request("/test_data.tar.gz").respond_with_handler(_range_handler(data, honor_ranges=False))
+        with _create_session() as session:
+            response = _open_test_data_url(session, httpserver.url_for("/test_data.tar.gz"))
+            with pytest.raises(IOError, match="not honored"):
+                _download_in_ranges(session, response, str(tmp_path / "test_data.tar.gz"))
+
+    @pytest.mark.unit
+    def test_extract_falls_back_to_single_request(self, httpserver: HTTPServer, tmp_path):
+        data = _make_tar({"data/file.txt": b"content"})
+        httpserver.expect_request("/test_data.tar.gz").respond_with_handler(_range_handler(data, honor_ranges=False))
+        test_dir = str(tmp_path / ".data")
+        test_data_archive = os.path.join(test_dir, "test_data.tar.gz")
+        with _create_session() as session:
+            response = _open_test_data_url(session, httpserver.url_for("/test_data.tar.gz"))
+            extract_data_from_tar(test_dir, test_data_archive, response=response, session=session)
+
+        assert (tmp_path / ".data" / "data" / "file.txt").read_bytes() == b"content"
+        with open(test_data_archive, "rb") as f:
+            assert f.read() == data
+
+
+class TestTestDataExtraction:
+    @pytest.fixture(params=[True, False], ids=["filters", "no_filters"])
+    def tarfile_filters(self, request, monkeypatch):
+        """Runs a test both with the tarfile extraction filters and with the fallback used when they are missing."""
+        if request.param and not hasattr(tarfile, "data_filter"):
+            pytest.skip("tarfile extraction filters are not available")
+        monkeypatch.setattr("tests.conftest.HAVE_TARFILE_FILTERS", request.param)
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("compressed", [True, False])
+    def test_extract_tar_stream(self, tmp_path, compressed, tarfile_filters):
+        large = os.urandom(2 * 1024 * 1024 + 1)
+        data = _make_tar(
+            {
+                "data": _tar_info(tarfile.DIRTYPE),
+                "data/subdir": _tar_info(tarfile.DIRTYPE, mtime=1234567890),
+                "data/subdir/file.txt": b"content",
+                "data/large.bin": large,
+                "data/symlink.txt": _tar_info(tarfile.SYMTYPE, linkname="subdir/file.txt"),
+                "data/hardlink.txt": _tar_info(tarfile.LNKTYPE, linkname="data/subdir/file.txt"),
+            },
+            compressed=compressed,
+        )
+        _extract_tar_stream(io.BytesIO(data), str(tmp_path), compressed=compressed)
+
+        root = tmp_path / "data"
+        assert (root / "subdir" / "file.txt").read_bytes() == b"content"
+        assert (root / "large.bin").read_bytes() == large
+        assert (root / "symlink.txt").is_symlink()
+        assert (root / "symlink.txt").read_bytes() == b"content"
+        assert (root / "hardlink.txt").stat().st_ino == (root / "subdir" / "file.txt").stat().st_ino
+        # Directory attributes are applied after the members inside them are written.
+        assert (root / "subdir").stat().st_mtime == 1234567890
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize(
+        "files",
+        [
+            {"../outside.txt": b"content"},
+            {"data/link": _tar_info(tarfile.SYMTYPE, linkname="../../outside.txt")},
+        ],
+    )
+    def test_extract_tar_stream_rejects_paths_outside(self, tmp_path, files, tarfile_filters):
+        destination = tmp_path / "destination"
+        destination.mkdir()
+        with pytest.raises(tarfile.TarError):
+            _extract_tar_stream(io.BytesIO(_make_tar(files)), str(destination))
+        assert not (tmp_path / "outside.txt").exists()
+
+    @pytest.mark.unit
+    def test_extract_tar_stream_last_member_wins(self, tmp_path):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+            for name, content in [("file.txt", b"old"), ("file.txt", b"new"), ("link.txt", b"old")]:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+            link = _tar_info(tarfile.SYMTYPE, linkname="file.txt")
+            link.name = "link.txt"
+            tar.addfile(link)
+        _extract_tar_stream(io.BytesIO(buffer.getvalue()), str(tmp_path))
+
+        assert (tmp_path / "file.txt").read_bytes() == b"new"
+        assert (tmp_path / "link.txt").is_symlink()
+        assert (tmp_path / "link.txt").read_bytes() == b"new"
+
+    @pytest.mark.unit
+    def test_is_extracted(self, tmp_path):
+        data = _make_tar({"data/file.txt": b"content"})
+        test_dir, test_data_archive = _local_test_data(tmp_path, data)
+        extract_data_from_tar(test_dir, test_data_archive, local_data=True)
+
+        test_data_sha256 = hashlib.sha256(data).hexdigest()
+        assert _is_extracted(test_dir, test_data_sha256)
+        # The extraction is from another archive.
+        assert not _is_extracted(test_dir, hashlib.sha256(b"other").hexdigest())
+        assert not _is_extracted(str(tmp_path / "missing"), test_data_sha256)
+        # Only the archive and the bookkeeping files are left.
+        (tmp_path / ".data" / "data" / "file.txt").unlink()
+        (tmp_path / ".data" / "data").rmdir()
+        assert not _is_extracted(test_dir, test_data_sha256)
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("reset_fails", [False, True])
+    def test_extract_local_data_keeps_archive(self, tmp_path, monkeypatch, reset_fails):
+        data = _make_tar({"data/file.txt": b"content"})
+        test_dir, test_data_archive = _local_test_data(tmp_path, data)
+        (tmp_path / ".data" / "stale.txt").write_bytes(b"stale")
+        # A file of the same name next to the test dir is left alone.
+        (tmp_path / "test_data.tar.gz").write_bytes(b"user file")
+        if reset_fails:
+            monkeypatch.setattr("tests.conftest.rmtree", mock.Mock(side_effect=OSError("reset failed")))
+            with pytest.raises(OSError, match="reset failed"):
+                extract_data_from_tar(test_dir, test_data_archive, local_data=True)
+        else:
+            extract_data_from_tar(test_dir, test_data_archive, local_data=True)
+            assert not (tmp_path / ".data" / "stale.txt").exists()
+            assert (tmp_path / ".data" / "data" / "file.txt").read_bytes() == b"content"
+
+        # The archive is moved back from `.test_data.tar.gz.staged`.
+        with open(test_data_archive, "rb") as f:
+            assert f.read() == data
+        assert sorted(os.listdir(tmp_path)) == [".data", "test_data.tar.gz"]
+        assert (tmp_path / "test_data.tar.gz").read_bytes() == b"user file"
+
+
+class TestEnvironRestore:
+    @pytest.mark.unit
+    def test_restore_environ(self):
+        os.environ["NEMO_TEST_UNCHANGED"] = "unchanged"
+        os.environ["NEMO_TEST_CHANGED"] = "before"
+        os.environ["NEMO_TEST_REMOVED"] = "removed"
+        snapshot = _take_environ_snapshot(SimpleNamespace())
+
+        os.environ["NEMO_TEST_CHANGED"] = "after"
+        os.environ["NEMO_TEST_ADDED"] = "added"
+        del os.environ["NEMO_TEST_REMOVED"]
+
+        with (
+            mock.patch.object(os, "putenv", wraps=os.putenv) as putenv,
+            mock.patch.object(os, "unsetenv", wraps=os.unsetenv) as unsetenv,
+        ):
+            _restore_environ(snapshot)
+
+        # Only the variables that differ from the snapshot are touched.
+        assert sorted(call.args[0] for call in putenv.call_args_list) == [b"NEMO_TEST_CHANGED", b"NEMO_TEST_REMOVED"]
+        assert [call.args[0] for call in unsetenv.call_args_list] == [b"NEMO_TEST_ADDED"]
+        assert dict(os.environ) == snapshot.environ
+        assert os.environ._data == snapshot.data
+
+
+class TestSkipMarkers:
+    @pytest.mark.unit
+    @pytest.mark.parametrize("device", ["CPU", "GPU"])
+    def test_closest_run_only_on_wins(self, device):
+        config = SimpleNamespace(stash=pytest.Stash())
+        config.stash[_NEMO_OPTS_KEY] = SimpleNamespace(cpu=device == "CPU", downloads=False, nightly=False)
+        # `iter_markers` yields the markers of the test itself before those of its class and module.
+        markers = [pytest.mark.run_only_on("CPU").mark, pytest.mark.run_only_on("GPU").mark]
+        request = SimpleNamespace(config=config, node=SimpleNamespace(iter_markers=lambda: iter(markers)))
+
+        if device == "CPU":
+            nemo_conftest.apply_skip_markers.__wrapped__(request, device)
+        else:
+            with pytest.raises(pytest.skip.Exception, match="skipped on this device: GPU"):
+                nemo_conftest.apply_skip_markers.__wrapped__(request, device)
+
+
+class TestSessionCache:
+    @pytest.mark.unit
+    def test_cached_value_hit(self):
+        config = SimpleNamespace(cache=_FakeCache({"nemo/probe": {"key": ["host", 1], "value": "cached"}}))
+        compute = mock.Mock(return_value="computed")
+        assert _cached_value(config, "probe", ["host", 1], compute) == "cached"
+        compute.assert_not_called()
+
+    @pytest.mark.unit
+    def test_cached_value_key_mismatch(self):
+        config = SimpleNamespace(cache=_FakeCache({"nemo/probe": {"key": ["host", 1], "value": "cached"}}))
+        assert _cached_value(config, "probe", ["host", 2], lambda: "computed") == "computed"
+        assert config.cache.values["nemo/probe"] == {"key": ["host", 2], "value": "computed"}
+
+    @pytest.mark.unit
+    def test_cached_value_without_cache(self):
+        # `config.cache` is missing when the cacheprovider plugin is disabled.
+        compute = mock.Mock(return_value="computed")
+        assert _cached_value(SimpleNamespace(), "probe", ["host", 1], compute) == "computed"
+        assert _cached_value(SimpleNamespace(), "probe", ["host", 1], compute) == "computed"
+        assert compute.call_count == 2
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("debug_k2", [False, True])
+    def test_k2_is_appropriate(self, monkeypatch, debug_k2):
+        monkeypatch.setattr("tests.conftest._k2_probe_key", lambda: ["host", "versions"])
+        monkeypatch.setattr("tests.conftest._probe_k2", mock.Mock(return_value=(False, "probed")))
+        cached = {"key": ["host", "versions"], "value": [True, "cached"]}
+        request = SimpleNamespace(config=SimpleNamespace(cache=_FakeCache({"nemo/k2_probe": cached})))
+        if debug_k2:
+            monkeypatch.setenv("NEMO_DEBUG_K2", "1")
+        else:
+            monkeypatch.delenv("NEMO_DEBUG_K2", raising=False)
+
+        # With NEMO_DEBUG_K2, the import is always retried so that its failure is logged.
+        expected = (False, "probed") if debug_k2 else (True, "cached")
+        assert nemo_conftest.k2_is_appropriate.__wrapped__(request) == expected